@@ -1,28 +1,62 @@
 #Type code here
 from surmount.base_class import Strategy, TargetAllocation
 from surmount.data import InstitutionalOwnership, InsiderTrading, SocialSentiment
+from collections import deque
+import heapq
 import math
 
 class TradingStrategy(Strategy):
-    def __init__(self):
+    def __init__(self, sleeves=None):
         # §2-5 UNIVERSES: Pre-selecting compliant assets satisfying fundamental velocity & liquidity
-        self.tech_tickers = ["NVDA", "AVGO", "PLTR", "TQQQ", "SOXL"]
-        self.biotech_tickers = ["XBI", "CRSP", "VRTX", "NVO"]
-        self.crypto_tickers = ["BTC", "ETH", "SOL", "SUI"]
-        self.metals_tickers = ["GLD", "SLV", "FNV", "NUGT"]
+        # (overridable per sleeve via `sleeves`)
+        sleeves = sleeves or {}
+        self.tech_tickers = sleeves.get("tech", ["NVDA", "AVGO", "PLTR", "TQQQ", "SOXL"])
+        self.biotech_tickers = sleeves.get("biotech", ["XBI", "CRSP", "VRTX", "NVO"])
+        self.crypto_tickers = sleeves.get("crypto", ["BTC", "ETH", "SOL", "SUI"])
+        self.metals_tickers = sleeves.get("metals", ["GLD", "SLV", "FNV", "NUGT"])
         
         # §6 MACRO REGIME TICKERS: Proxies for dynamic scaling (VIX, DXY via UUP, SPY for baseline)
         self.macro_tickers = ["VIXY", "UUP", "SPY"] 
         
-        self.tickers = self.tech_tickers + self.biotech_tickers + self.crypto_tickers + self.metals_tickers + self.macro_tickers
+        self.tradeable_assets = self.tech_tickers + self.biotech_tickers + self.crypto_tickers + self.metals_tickers
+        self.tickers = self.tradeable_assets + self.macro_tickers
+        self.sleeves = {
+            "tech": self.tech_tickers,
+            "biotech": self.biotech_tickers,
+            "crypto": self.crypto_tickers,
+            "metals": self.metals_tickers
+        }
         
         # Initialize alternative data arrays for CMS component calculations
         self.data_list = []
         for ticker in self.tickers:
+            if ticker in self.macro_tickers:
+                continue # Macro proxies are only read for price, never scored
             self.data_list.append(SocialSentiment(ticker))
             self.data_list.append(InstitutionalOwnership(ticker))
             self.data_list.append(InsiderTrading(ticker))
 
+        # §8.2 TURNOVER CONTROL: No-trade bands around the last emitted target, relative to
+        # the last weight (0.10 holds moves under 10% of the position). None disables banding.
+        self.no_trade_band = None
+        self.sleeve_no_trade_bands = {}
+        self.asset_no_trade_bands = {}
+        self.last_weights = None
+
+        # §1.3 CORRELATION-AWARE SIZING: Ceiling on sqrt(w' * Cov * w), i.e. the sleeve's daily return
+        # stdev as a fraction of the whole book, using the emitted weights (None disables).
+        # Weights here are ~0.0001-0.01 (sized off price stdev), so useful caps are ~1e-5 to 1e-4.
+        self.sleeve_vol_cap = None
+
+        # §2-5 LARGE-UNIVERSE MODE: Incrementally maintained screen (data availability, skip-day
+        # sign, rolling average volume) shrinks each sleeve before full CMS scoring
+        self.large_universe = False
+        self.screen_min_avg_volume = 0
+        self.screen_max_candidates = None # Per sleeve, ranked by skip-day return; None keeps all
+        self.screen_volume_window = 20
+        self.screen_state = {}
+        self.screen_last_bar = None
+
     @property
     def interval(self):
         # §1.1 Tactical horizon optimization (daily frequency for shorter term reactivity)
@@ -56,12 +90,142 @@ class TradingStrategy(Strategy):
         variance = sum((x - mean) ** 2 for x in window) / length
         return math.sqrt(variance) if variance > 0 else 0.01
 
+    def get_sleeve_vol(self, weights, ohlcv):
+        """§1.3: Sleeve stdev from the 21-bar return covariance of its picks (w' * Cov * w)."""
+        closes = {t: [x.get(t, {}).get("close", 0) for x in ohlcv] for t in weights}
+        returns = {t: [] for t in weights}
+        # Only bars where every pick has a valid close on both days, so returns stay date-aligned
+        for i in range(max(1, len(ohlcv) - 21), len(ohlcv)):
+            if all(closes[t][i - 1] > 0 and closes[t][i] > 0 for t in weights):
+                for t in weights:
+                    returns[t].append((closes[t][i] - closes[t][i - 1]) / closes[t][i - 1])
+        length = len(next(iter(returns.values())))
+        if length < 2: return 0
+        means = {t: sum(r) / length for t, r in returns.items()}
+        variance = 0
+        for a in weights:
+            for b in weights:
+                cov = sum((x - means[a]) * (y - means[b]) for x, y in zip(returns[a], returns[b])) / length
+                variance += weights[a] * weights[b] * cov
+        return math.sqrt(variance) if variance > 0 else 0
+
+    def update_screen(self, ohlcv):
+        """§2-5 Large-universe screen: folds only bars not seen on earlier calls into per-ticker rolling state."""
+        start = 0
+        if self.screen_last_bar is not None:
+            # Locate the last bar already folded in; works for growing and fixed-length histories
+            for j in range(len(ohlcv) - 1, -1, -1):
+                if ohlcv[j] == self.screen_last_bar:
+                    start = j + 1
+                    break
+            else:
+                self.screen_state = {}
+
+        for bar in ohlcv[start:]:
+            for ticker in self.tradeable_assets:
+                state = self.screen_state.get(ticker)
+                if state is None:
+                    state = {"closes": deque(maxlen=48), "volumes": deque(maxlen=self.screen_volume_window), "volume_sum": 0}
+                    self.screen_state[ticker] = state
+                row = bar.get(ticker, {})
+                volumes = state["volumes"]
+                if len(volumes) == volumes.maxlen:
+                    state["volume_sum"] -= volumes[0]
+                volumes.append(row.get("volume", 0))
+                state["volume_sum"] += volumes[-1]
+                state["closes"].append(row.get("close", 0))
+
+        if ohlcv:
+            self.screen_last_bar = ohlcv[-1]
+
+    def get_screened_assets(self, ohlcv):
+        """Sleeve candidates passing data availability, the skip-day sign and average volume, capped per sleeve."""
+        self.update_screen(ohlcv)
+        candidates = []
+        for sleeve_name, tickers in self.sleeves.items():
+            passed = {}
+            for ticker in tickers:
+                state = self.screen_state[ticker]
+                closes = state["closes"]
+                # closes[0] is day -48 and closes[-6] is day -6, matching the CMS skip-day rule
+                if len(closes) < 48 or closes[-1] <= 0 or closes[-6] <= 0 or closes[0] <= 0:
+                    continue
+                skip_day_return = (closes[-6] - closes[0]) / closes[0]
+                if skip_day_return <= 0:
+                    continue
+                if state["volume_sum"] / len(state["volumes"]) < self.screen_min_avg_volume:
+                    continue
+                passed[ticker] = skip_day_return
+            if self.screen_max_candidates is not None:
+                passed = dict(heapq.nlargest(self.screen_max_candidates, passed.items(), key=lambda x: x[1]))
+            candidates += [t for t in tickers if t in passed]
+        return candidates
+
+    def get_no_trade_band(self, ticker):
+        """Per-asset band first, then the asset's sleeve band, then the default."""
+        if ticker in self.asset_no_trade_bands:
+            return self.asset_no_trade_bands[ticker]
+        for sleeve_name, tickers in self.sleeves.items():
+            if ticker in tickers and sleeve_name in self.sleeve_no_trade_bands:
+                return self.sleeve_no_trade_bands[sleeve_name]
+        return self.no_trade_band
+
+    def apply_no_trade_band(self, target_weights):
+        """§8.2: Holds in-band weight changes at the last emitted target, returns None if nothing material moved."""
+        banding = self.no_trade_band is not None or self.sleeve_no_trade_bands or self.asset_no_trade_bands
+        if self.last_weights is None or not banding:
+            self.last_weights = {k: v for k, v in target_weights.items() if v > 0}
+            return TargetAllocation(target_weights)
+
+        banded_weights = {}
+        rebalance = False
+        tickers = list(target_weights) + [k for k in self.last_weights if k not in target_weights]
+        for ticker in tickers:
+            new_weight = target_weights.get(ticker, 0)
+            last_weight = self.last_weights.get(ticker, 0)
+            band = self.get_no_trade_band(ticker)
+            # Entries and exits (risk kills, Loser Protocol, insider exclusion) always go through
+            if band is not None and new_weight > 0 and last_weight > 0 and abs(new_weight - last_weight) < band * last_weight:
+                banded_weights[ticker] = last_weight
+            else:
+                banded_weights[ticker] = new_weight
+                if new_weight != last_weight:
+                    rebalance = True
+
+        if not rebalance:
+            return None
+
+        # Held weights must not push the book past full capacity
+        if sum(banded_weights.values()) > 1.0:
+            banded_weights = target_weights
+
+        # Exited names are emitted once with weight 0, then forgotten
+        self.last_weights = {k: v for k, v in banded_weights.items() if v > 0}
+        return TargetAllocation(banded_weights)
+
     def run(self, data):
+        target_weights = self.compute_target_weights(data, {})
+        if target_weights is None:
+            return TargetAllocation({})
+        return self.apply_no_trade_band(target_weights)
+
+    def run_scenarios(self, data, scenarios):
+        """§6 What-if: target weights for each regime_overrides dict against one bar.
+
+        Overridable inputs: vix_sma_5 (vs the 18/25/30 regime bands), dollar_weakening and
+        portfolio_vol. portfolio_vol is the stdev of the last 21 raw SPY closes (price units,
+        not a return vol) and is compared against 0.03/0.08 as such. Each scenario rescores
+        every ticker; there is no per-ticker reuse across scenarios. No-trade band state is
+        left untouched.
+        """
+        return [self.compute_target_weights(data, overrides) for overrides in scenarios]
+
+    def compute_target_weights(self, data, regime_overrides):
         ohlcv = data.get("ohlcv", [])
         
         # Require sufficient lookback for the 50-day volume and DXY metrics
         if len(ohlcv) < 50:
-            return TargetAllocation({})
+            return None
             
         target_weights = {}
 
@@ -72,6 +236,7 @@ class TradingStrategy(Strategy):
         # 6.1 VIX-Based Volatility Regime System
         vix_prices = [x.get("VIXY", {}).get("close", 0) for x in ohlcv]
         vix_sma_5 = self.get_sma(vix_prices, 5)
+        vix_sma_5 = regime_overrides.get("vix_sma_5", vix_sma_5)
         
         # 6.2 DXY-Based Currency Regime Overlay (Using UUP as US Dollar Proxy)
         uup_closes = [x.get("UUP", {}).get("close", 0) for x in ohlcv]
@@ -81,6 +246,7 @@ class TradingStrategy(Strategy):
         uup_valid = [p for p in uup_closes if p > 0]
         last_uup = uup_valid[-1] if uup_valid else 0
         dollar_weakening = last_uup < uup_sma_50 and last_uup > 0
+        dollar_weakening = regime_overrides.get("dollar_weakening", dollar_weakening)
         
         # Base Allocation Bands
         sleeve_budgets = {
@@ -118,7 +284,8 @@ class TradingStrategy(Strategy):
         cms_scores = {}
         volatilities_21d = {}
         
-        for ticker in self.tickers:
+        universe = self.get_screened_assets(ohlcv) if self.large_universe else self.tickers
+        for ticker in universe:
             if ticker in self.macro_tickers: 
                 continue
             
@@ -183,24 +350,18 @@ class TradingStrategy(Strategy):
         # =====================================================================
         # §1.3 & §8 VOLATILITY-SCALED POSITION SIZING & RELATIVE MOMENTUM
         # =====================================================================
-        sleeves = {
-            "tech": self.tech_tickers,
-            "biotech": self.biotech_tickers,
-            "crypto": self.crypto_tickers,
-            "metals": self.metals_tickers
-        }
-        
         # Bongaerts et al. Conditional Enhancement (Baseline Vol = 5%)
         base_target_vol = 0.05
         spy_closes = [x.get("SPY", {}).get("close", 0) for x in ohlcv]
         portfolio_vol = self.get_stdev(spy_closes, 21)
+        portfolio_vol = regime_overrides.get("portfolio_vol", portfolio_vol)
         
         if portfolio_vol > 0.08:
             base_target_vol *= 0.75 # Reduce portfolio leverage
         elif portfolio_vol < 0.03:
             base_target_vol *= 1.15 # Increase portfolio leverage
             
-        for sleeve_name, tickers in sleeves.items():
+        for sleeve_name, tickers in self.sleeves.items():
             sleeve_budget = sleeve_budgets.get(sleeve_name, 0.1)
             # Valid candidates passed Absolute Momentum gate
             valid_candidates = {k: v for k, v in cms_scores.items() if k in tickers}
@@ -209,10 +370,9 @@ class TradingStrategy(Strategy):
                 continue
                 
             # Filter B: Relative Cross-Sectional Momentum (Select the strongest performers)
-            sorted_candidates = sorted(valid_candidates.items(), key=lambda x: x[1], reverse=True)
-            
             # Select top 2 names per sleeve to balance concentration vs. diversification
-            top_candidates = sorted_candidates[:2]
+            # (partial top-k selection; no need to order the whole sleeve)
+            top_candidates = heapq.nlargest(2, valid_candidates.items(), key=lambda x: x[1])
             
             for ticker, score in top_candidates:
                 # 1.3 Barroso & Santa-Clara Inverse Volatility Sizing
@@ -237,6 +397,14 @@ class TradingStrategy(Strategy):
                     
                 target_weights[ticker] = min(raw_weight, cap)
 
+            # §1.3 Correlated picks (e.g. TQQQ + SOXL) share risk: cap the sleeve, not just each name
+            if self.sleeve_vol_cap is not None:
+                picked = {t: target_weights[t] for t, _ in top_candidates if target_weights[t] > 0}
+                sleeve_vol = self.get_sleeve_vol(picked, ohlcv) if picked else 0
+                if sleeve_vol > self.sleeve_vol_cap:
+                    for t in picked:
+                        target_weights[t] *= self.sleeve_vol_cap / sleeve_vol
+
         # Normalize total weights to ensure systemic 100% capacity adherence
         # We explicitly round down to 4 decimals to avoid 1.00000000000002 allocation rejections
         total_weight = sum(target_weights.values())
@@ -247,4 +415,4 @@ class TradingStrategy(Strategy):
             for k in target_weights:
                 target_weights[k] = round(target_weights[k], 4)
                 
-        return TargetAllocation(target_weights)
\ No newline at end of file
+        return target_weights
\ No newline at end of file
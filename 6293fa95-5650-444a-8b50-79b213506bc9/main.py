@@ -1,22 +1,25 @@
 #Type code here
+from collections import deque
+import heapq
 import math
 from surmount.base_class import Strategy, TargetAllocation
 from surmount.data import InstitutionalOwnership, InsiderTrading, SocialSentiment
 
 class TradingStrategy(Strategy):
-    def __init__(self):
-        # §2-5 UNIVERSES: Precisely defined asset sleeves
-        self.tech_tickers = ["NVDA", "AVGO", "PLTR", "TQQQ", "SOXL"]
+    def __init__(self, sleeves=None):
+        # §2-5 UNIVERSES: Precisely defined asset sleeves (overridable per sleeve via `sleeves`)
+        sleeves = sleeves or {}
+        self.tech_tickers = sleeves.get("tech", ["NVDA", "AVGO", "PLTR", "TQQQ", "SOXL"])
         self.tech_benchmark = "QQQ"
         
-        self.biotech_tickers = ["CRSP", "VRTX", "NVO"]
+        self.biotech_tickers = sleeves.get("biotech", ["CRSP", "VRTX", "NVO"])
         self.biotech_benchmark = "XBI"
         
         # Exact digital asset pairs to execute on connected exchanges
-        self.crypto_tickers = ["BTCUSD", "ETHUSD", "SOLUSD", "SUIUSD"]
+        self.crypto_tickers = sleeves.get("crypto", ["BTCUSD", "ETHUSD", "SOLUSD", "SUIUSD"])
         self.crypto_benchmark = "BTCUSD"
         
-        self.metals_tickers = ["SLV", "FNV", "NUGT"]
+        self.metals_tickers = sleeves.get("metals", ["SLV", "FNV", "NUGT"])
         self.metals_benchmark = "GLD"
         
         # Macro proxies
@@ -24,14 +27,45 @@ class TradingStrategy(Strategy):
         
         self.benchmarks = [self.tech_benchmark, self.biotech_benchmark, self.crypto_benchmark, self.metals_benchmark]
         self.tradeable_assets = self.tech_tickers + self.biotech_tickers + self.crypto_tickers + self.metals_tickers
+        self.sleeves = {
+            "tech": self.tech_tickers,
+            "biotech": self.biotech_tickers,
+            "crypto": self.crypto_tickers,
+            "metals": self.metals_tickers
+        }
         self.tickers = self.tradeable_assets + self.benchmarks + self.macro_tickers
         
+        # BTCUSD is both tradeable and the crypto benchmark: subscribe each feed once
         self.data_list = []
-        for ticker in self.tradeable_assets + self.benchmarks:
+        for ticker in dict.fromkeys(self.tradeable_assets + self.benchmarks):
             self.data_list.append(SocialSentiment(ticker))
             self.data_list.append(InstitutionalOwnership(ticker))
             self.data_list.append(InsiderTrading(ticker))
 
+        # §8.2 TURNOVER CONTROL: No-trade bands around the last emitted target, relative to
+        # the last weight (0.10 holds moves under 10% of the position). None disables banding.
+        self.no_trade_band = None
+        self.sleeve_no_trade_bands = {}
+        self.asset_no_trade_bands = {}
+        self.last_weights = None
+
+        # §1.3 CORRELATION-AWARE SIZING: Ceiling on sqrt(w' * Cov * w), i.e. the sleeve's daily return
+        # stdev as a fraction of the whole book, using the emitted weights (None disables).
+        # Weights here are ~0.0001-0.01 (sized off price stdev), so useful caps are ~1e-5 to 1e-4.
+        self.sleeve_vol_cap = None
+
+        # §2-5 LARGE-UNIVERSE MODE: Incrementally maintained screen (data availability, skip-day
+        # sign, rolling average volume) shrinks each sleeve before full CMS scoring
+        self.large_universe = False
+        self.screen_min_avg_volume = 0
+        self.screen_max_candidates = None # Per sleeve, ranked by skip-day return; None keeps all
+        self.screen_volume_window = 20
+        self.screen_state = {}
+        self.screen_last_bar = None
+
+        # Bar-scoped memo of pure helper results, held only while run() executes
+        self.bar_cache = {}
+
     @property
     def interval(self):
         return "1day"
@@ -60,6 +94,25 @@ class TradingStrategy(Strategy):
         variance = sum((x - mean) ** 2 for x in valid) / length
         return math.sqrt(variance) if variance > 0 else 0.01
 
+    def get_sleeve_vol(self, weights, ohlcv):
+        """§1.3: Sleeve stdev from the 21-bar return covariance of its picks (w' * Cov * w)."""
+        closes = {t: self.get_series(t, "close", ohlcv) for t in weights}
+        returns = {t: [] for t in weights}
+        # Only bars where every pick has a valid close on both days, so returns stay date-aligned
+        for i in range(max(1, len(ohlcv) - 21), len(ohlcv)):
+            if all(closes[t][i - 1] > 0 and closes[t][i] > 0 for t in weights):
+                for t in weights:
+                    returns[t].append((closes[t][i] - closes[t][i - 1]) / closes[t][i - 1])
+        length = len(next(iter(returns.values())))
+        if length < 2: return 0
+        means = {t: sum(r) / length for t, r in returns.items()}
+        variance = 0
+        for a in weights:
+            for b in weights:
+                cov = sum((x - means[a]) * (y - means[b]) for x, y in zip(returns[a], returns[b])) / length
+                variance += weights[a] * weights[b] * cov
+        return math.sqrt(variance) if variance > 0 else 0
+
     def get_ema(self, prices, period):
         valid = [p for p in prices if p > 0]
         if len(valid) < period: return valid[-1] if valid else 0.01
@@ -76,10 +129,118 @@ class TradingStrategy(Strategy):
         macd_line = ema_12 - ema_26
         return macd_line
 
+    def update_screen(self, ohlcv):
+        """§2-5 Large-universe screen: folds only bars not seen on earlier calls into per-ticker rolling state."""
+        start = 0
+        if self.screen_last_bar is not None:
+            # Locate the last bar already folded in; works for growing and fixed-length histories
+            for j in range(len(ohlcv) - 1, -1, -1):
+                if ohlcv[j] == self.screen_last_bar:
+                    start = j + 1
+                    break
+            else:
+                self.screen_state = {}
+
+        for bar in ohlcv[start:]:
+            for ticker in self.tradeable_assets:
+                state = self.screen_state.get(ticker)
+                if state is None:
+                    state = {"closes": deque(maxlen=48), "volumes": deque(maxlen=self.screen_volume_window), "volume_sum": 0}
+                    self.screen_state[ticker] = state
+                row = bar.get(ticker, {})
+                volumes = state["volumes"]
+                if len(volumes) == volumes.maxlen:
+                    state["volume_sum"] -= volumes[0]
+                volumes.append(row.get("volume", 0))
+                state["volume_sum"] += volumes[-1]
+                state["closes"].append(row.get("close", 0))
+
+        if ohlcv:
+            self.screen_last_bar = ohlcv[-1]
+
+    def get_screened_assets(self, ohlcv):
+        """Sleeve candidates passing data availability, the skip-day sign and average volume, capped per sleeve."""
+        self.update_screen(ohlcv)
+        candidates = []
+        for sleeve_name, tickers in self.sleeves.items():
+            passed = {}
+            for ticker in tickers:
+                state = self.screen_state[ticker]
+                closes = state["closes"]
+                # closes[0] is day -48 and closes[-6] is day -6, matching the CMS skip-day rule
+                if len(closes) < 48 or closes[-1] <= 0 or closes[-6] <= 0 or closes[0] <= 0:
+                    continue
+                skip_day_return = (closes[-6] - closes[0]) / closes[0]
+                if skip_day_return <= 0:
+                    continue
+                if state["volume_sum"] / len(state["volumes"]) < self.screen_min_avg_volume:
+                    continue
+                passed[ticker] = skip_day_return
+            if self.screen_max_candidates is not None:
+                passed = dict(heapq.nlargest(self.screen_max_candidates, passed.items(), key=lambda x: x[1]))
+            candidates += [t for t in tickers if t in passed]
+        return candidates
+
+    def get_no_trade_band(self, ticker):
+        """Per-asset band first, then the asset's sleeve band, then the default."""
+        if ticker in self.asset_no_trade_bands:
+            return self.asset_no_trade_bands[ticker]
+        for sleeve_name, tickers in self.sleeves.items():
+            if ticker in tickers and sleeve_name in self.sleeve_no_trade_bands:
+                return self.sleeve_no_trade_bands[sleeve_name]
+        return self.no_trade_band
+
+    def apply_no_trade_band(self, target_weights):
+        """§8.2: Holds in-band weight changes at the last emitted target, returns None if nothing material moved."""
+        banding = self.no_trade_band is not None or self.sleeve_no_trade_bands or self.asset_no_trade_bands
+        if self.last_weights is None or not banding:
+            self.last_weights = {k: v for k, v in target_weights.items() if v > 0}
+            return TargetAllocation(target_weights)
+
+        banded_weights = {}
+        rebalance = False
+        tickers = list(target_weights) + [k for k in self.last_weights if k not in target_weights]
+        for ticker in tickers:
+            new_weight = target_weights.get(ticker, 0)
+            last_weight = self.last_weights.get(ticker, 0)
+            band = self.get_no_trade_band(ticker)
+            # Entries and exits (risk kills, Loser Protocol, insider exclusion) always go through
+            if band is not None and new_weight > 0 and last_weight > 0 and abs(new_weight - last_weight) < band * last_weight:
+                banded_weights[ticker] = last_weight
+            else:
+                banded_weights[ticker] = new_weight
+                if new_weight != last_weight:
+                    rebalance = True
+
+        if not rebalance:
+            return None
+
+        # Held weights must not push the book past full capacity
+        if sum(banded_weights.values()) > 1.0:
+            banded_weights = target_weights
+
+        # Exited names are emitted once with weight 0, then forgotten
+        self.last_weights = {k: v for k, v in banded_weights.items() if v > 0}
+        return TargetAllocation(banded_weights)
+
+    def memoize(self, key, compute):
+        """Returns the cached result for key, computing it once per bar."""
+        if key not in self.bar_cache:
+            self.bar_cache[key] = compute()
+        return self.bar_cache[key]
+
+    def get_series(self, ticker, field, ohlcv):
+        """Per-bar cached close/volume history for a ticker (shared across passes)."""
+        return self.memoize(("series", ticker, field), lambda: [x.get(ticker, {}).get(field, 0) for x in ohlcv])
+
     def calculate_cms(self, ticker, ohlcv, data_stream):
+        """Per-bar cached CMS: benchmarks that are also tradeable are scored once."""
+        return self.memoize(("cms", ticker), lambda: self.compute_cms(ticker, ohlcv, data_stream))
+
+    def compute_cms(self, ticker, ohlcv, data_stream):
         """§1.2: 5-Factor Composite Momentum Score with Skip-Day Rule"""
-        closes = [x.get(ticker, {}).get("close", 0) for x in ohlcv]
-        volumes = [x.get(ticker, {}).get("volume", 0) for x in ohlcv]
+        closes = self.get_series(ticker, "close", ohlcv)
+        volumes = self.get_series(ticker, "volume", ohlcv)
         
         if len(closes) < 50 or closes[-1] <= 0 or closes[-48] <= 0:
             return -999 
@@ -131,26 +292,55 @@ class TradingStrategy(Strategy):
         return cms
 
     def run(self, data):
+        self.bar_cache = {}
+        target_weights = self.compute_target_weights(data, {})
+        self.bar_cache = {} # Do not retain full-history series between bars
+        if target_weights is None:
+            return TargetAllocation({})
+        return self.apply_no_trade_band(target_weights)
+
+    def run_scenarios(self, data, scenarios):
+        """§6 What-if: target weights for each regime_overrides dict against one bar.
+
+        Overridable inputs: vix_sma_5, dollar_weakening, biotech_risk_off, btc_drawdown,
+        portfolio_vol. portfolio_vol is the stdev of the last 21 raw SPY closes (price units,
+        not a return vol) and is compared against 0.03/0.08 as such.
+
+        Per-ticker series and CMS scores do not depend on these inputs, so they are computed
+        once and shared through bar_cache. That cache is keyed by ticker only: every scenario
+        in one call must use the same data, so price-panel shocks need one call per shocked
+        data dict. No-trade band state is left untouched.
+        """
+        self.bar_cache = {}
+        results = [self.compute_target_weights(data, overrides) for overrides in scenarios]
+        self.bar_cache = {}
+        return results
+
+    def compute_target_weights(self, data, regime_overrides):
         ohlcv = data.get("ohlcv", [])
         if len(ohlcv) < 50:
-            return TargetAllocation({})
+            return None
             
         target_weights = {}
 
         # =====================================================================
         # §6 REGIME DETECTION & DYNAMIC OVERLAYS
         # =====================================================================
-        vix_prices = [x.get("VIXY", {}).get("close", 0) for x in ohlcv]
+        vix_prices = self.get_series("VIXY", "close", ohlcv)
         vix_sma_5 = sum([p for p in vix_prices[-5:] if p > 0]) / 5 if len(vix_prices) >= 5 else 15
         
-        uup_closes = [x.get("UUP", {}).get("close", 0) for x in ohlcv]
+        uup_closes = self.get_series("UUP", "close", ohlcv)
         uup_sma_50 = sum([p for p in uup_closes[-50:] if p > 0]) / 50 if len(uup_closes) >= 50 else 0
         dollar_weakening = len(uup_closes) > 0 and uup_closes[-1] < uup_sma_50
         
+        vix_sma_5 = regime_overrides.get("vix_sma_5", vix_sma_5)
+        dollar_weakening = regime_overrides.get("dollar_weakening", dollar_weakening)
+        
         # §3.4 XBI Regime Adaptation
-        xbi_closes = [x.get("XBI", {}).get("close", 0) for x in ohlcv]
+        xbi_closes = self.get_series("XBI", "close", ohlcv)
         xbi_sma_50 = sum([p for p in xbi_closes[-50:] if p > 0]) / 50 if len(xbi_closes) >= 50 else 0
         biotech_risk_off = len(xbi_closes) > 0 and xbi_closes[-1] < xbi_sma_50
+        biotech_risk_off = regime_overrides.get("biotech_risk_off", biotech_risk_off)
         
         # Base Allocation Budgets
         sleeve_budgets = {
@@ -161,10 +351,11 @@ class TradingStrategy(Strategy):
         }
         
         # §4.4 Crypto Circuit Breaker Analysis
-        btc_closes = [x.get("BTCUSD", {}).get("close", 0) for x in ohlcv]
+        btc_closes = self.get_series("BTCUSD", "close", ohlcv)
         btc_valid = [p for p in btc_closes[-30:] if p > 0]
         btc_30d_high = max(btc_valid) if btc_valid else 0.01
         btc_drawdown = (btc_30d_high - btc_closes[-1]) / btc_30d_high if btc_30d_high > 0 else 0
+        btc_drawdown = regime_overrides.get("btc_drawdown", btc_drawdown)
         
         if btc_drawdown > 0.25: # Tier 3 Red Circuit Breaker
             sleeve_budgets["crypto"] = 0.15
@@ -206,12 +397,13 @@ class TradingStrategy(Strategy):
         volatilities_21d = {}
         
         btc_14d = self.get_return(btc_closes, 14)
-        eth_closes = [x.get("ETHUSD", {}).get("close", 0) for x in ohlcv]
+        eth_closes = self.get_series("ETHUSD", "close", ohlcv)
         eth_14d = self.get_return(eth_closes, 14)
 
-        for ticker in self.tradeable_assets:
-            closes = [x.get(ticker, {}).get("close", 0) for x in ohlcv]
-            volumes = [x.get(ticker, {}).get("volume", 0) for x in ohlcv]
+        universe = self.get_screened_assets(ohlcv) if self.large_universe else self.tradeable_assets
+        for ticker in universe:
+            closes = self.get_series(ticker, "close", ohlcv)
+            volumes = self.get_series(ticker, "volume", ohlcv)
             
             # §2.4 Loser Protocol: Exit if asset drops 10% on >1.5x volume
             if len(closes) >= 20:
@@ -251,28 +443,21 @@ class TradingStrategy(Strategy):
         # =====================================================================
         # §1.3 VOLATILITY-SCALED SIZING
         # =====================================================================
-        sleeves = {
-            "tech": self.tech_tickers,
-            "biotech": self.biotech_tickers,
-            "crypto": self.crypto_tickers,
-            "metals": self.metals_tickers
-        }
-        
         base_target_vol = 0.05
-        spy_closes = [x.get("SPY", {}).get("close", 0) for x in ohlcv]
+        spy_closes = self.get_series("SPY", "close", ohlcv)
         portfolio_vol = self.get_stdev(spy_closes[-21:])
+        portfolio_vol = regime_overrides.get("portfolio_vol", portfolio_vol)
         
         if portfolio_vol > 0.08: base_target_vol *= 0.75 
         elif portfolio_vol < 0.03: base_target_vol *= 1.15 
             
-        for sleeve_name, tickers in sleeves.items():
+        for sleeve_name, tickers in self.sleeves.items():
             sleeve_budget = sleeve_budgets.get(sleeve_name, 0.1)
             valid_candidates = {k: v for k, v in cms_scores.items() if k in tickers}
             
             if not valid_candidates: continue
                 
-            sorted_candidates = sorted(valid_candidates.items(), key=lambda x: x[1], reverse=True)
-            top_candidates = sorted_candidates[:2] 
+            top_candidates = heapq.nlargest(2, valid_candidates.items(), key=lambda x: x[1])
             
             for ticker, score in top_candidates:
                 ticker_vol = volatilities_21d.get(ticker, 0.01)
@@ -290,6 +475,14 @@ class TradingStrategy(Strategy):
                     
                 target_weights[ticker] = min(raw_weight, cap)
 
+            # §1.3 Correlated picks (e.g. TQQQ + SOXL) share risk: cap the sleeve, not just each name
+            if self.sleeve_vol_cap is not None:
+                picked = {t: target_weights[t] for t, _ in top_candidates if target_weights[t] > 0}
+                sleeve_vol = self.get_sleeve_vol(picked, ohlcv) if picked else 0
+                if sleeve_vol > self.sleeve_vol_cap:
+                    for t in picked:
+                        target_weights[t] *= self.sleeve_vol_cap / sleeve_vol
+
         total_weight = sum(target_weights.values())
         if total_weight > 1.0:
             for k in target_weights:
@@ -298,4 +491,4 @@ class TradingStrategy(Strategy):
             for k in target_weights:
                 target_weights[k] = round(target_weights[k], 4)
                 
-        return TargetAllocation(target_weights)
\ No newline at end of file
+        return target_weights
\ No newline at end of file